@@ -0,0 +1,47 @@
+"""
+One-off migration: remove duplicate budgets
+
+Older versions inserted a new budget document on every POST /api/budgets, which
+leaves several documents per (month, category) and blocks the unique index the
+API creates at startup. This keeps the newest budget of each pair (by
+updated_at, then created_at) and deletes the rest.
+
+Usage:
+    python dedupe_budgets.py          # report what would be removed
+    python dedupe_budgets.py --apply  # actually delete the duplicates
+"""
+
+import argparse
+import asyncio
+
+from database import db
+
+
+async def dedupe_budgets(apply: bool) -> int:
+    """Return how many duplicate budgets exist, deleting them when `apply` is set"""
+    pipeline = [
+        {"$sort": {"updated_at": -1, "created_at": -1}},
+        {"$group": {"_id": {"month": "$month", "category": "$category"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    stale = []
+    async for group in db["budget"].aggregate(pipeline):
+        print(f"{group['_id']['month']} {group['_id']['category']}: keeping {group['ids'][0]}, "
+              f"{len(group['ids']) - 1} duplicate(s)")
+        stale.extend(group["ids"][1:])
+    if stale and apply:
+        await db["budget"].delete_many({"_id": {"$in": stale}})
+    return len(stale)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="delete duplicates instead of only reporting them")
+    args = parser.parse_args()
+    if db is None:
+        raise SystemExit("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    count = asyncio.run(dedupe_budgets(args.apply))
+    if args.apply:
+        print(f"Removed {count} duplicate budget(s)")
+    else:
+        print(f"Found {count} duplicate budget(s); re-run with --apply to delete them")
@@ -1,33 +1,130 @@
+import asyncio
+import logging
 import os
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-
-from database import db, create_document, get_documents
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Annotated, List, Optional, Dict, Any, Tuple
+
+import ahocorasick
+import orjson
+
+from fastapi import Body, FastAPI, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError, ServerSelectionTimeoutError
+
+from database import db, create_document, create_documents, get_documents
 from schemas import Transaction, CategoryRule, Budget
-from bson import ObjectId
-
-app = FastAPI(title="Spend Tracker API")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Spend Tracker API", default_response_class=ORJSONResponse)
+
+# CORS_ORIGIN pins the allowed origin; the default "*" echoes the caller's Origin,
+# which browsers require for credentialed requests.
+_CORS_ORIGIN = os.getenv("CORS_ORIGIN", "*").encode("latin-1")
+_CORS_HEADERS = [(b"access-control-allow-credentials", b"true"), (b"vary", b"Origin")]
+_CORS_PREFLIGHT_HEADERS = [
+    (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+    (b"access-control-max-age", b"600"),
+    (b"content-type", b"text/plain; charset=utf-8"),
+    (b"content-length", b"2"),
+]
+
+
+class FastCORS:
+    """Allow-all CORS middleware that appends precomputed header tuples.
+
+    Equivalent to CORSMiddleware with every origin, method and header allowed
+    plus credentials, without its per-request origin and header checks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        origin = headers.get(b"origin")
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        cors = [(b"access-control-allow-origin", origin if _CORS_ORIGIN == b"*" else _CORS_ORIGIN), *_CORS_HEADERS]
+        if scope["method"] == "OPTIONS" and b"access-control-request-method" in headers:
+            allow_headers = headers.get(b"access-control-request-headers", b"")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [*cors, *_CORS_PREFLIGHT_HEADERS, (b"access-control-allow-headers", allow_headers)],
+            })
+            await send({"type": "http.response.body", "body": b"OK"})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *cors]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app.add_middleware(FastCORS)
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+
+# (collection, keys, options) for the indexes backing the transaction list,
+# insights and budget lookups
+_INDEXES = [
+    ("transaction", [("date", -1)], {}),
+    ("transaction", [("category", 1), ("date", -1)], {}),
+    ("transaction", [("_search", "text")], {}),
+    ("budget", [("month", 1), ("category", 1)], {"unique": True}),
+    ("categoryrule", [("keyword", 1)], {}),
+]
+
+
+async def ensure_indexes() -> None:
+    """Create the indexes in `_INDEXES`, logging failures instead of raising."""
+    for collection, keys, options in _INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except ServerSelectionTimeoutError:
+            logger.exception("Database unreachable; skipping index creation")
+            return
+        except DuplicateKeyError:
+            logger.error(
+                "Could not create unique index %s on %s because of duplicate documents; "
+                "run `python dedupe_budgets.py` to review and remove them",
+                keys, collection,
+            )
+        except PyMongoError:
+            logger.exception("Could not create index %s on %s", keys, collection)
+
+
+@app.on_event("startup")
+async def start_index_build():
+    # Run in the background so an unreachable database does not hold up startup;
+    # /test reports the connection problem as before.
+    if db is not None:
+        app.state.index_task = asyncio.create_task(ensure_indexes())
+
+
+_ROOT_BYTES = orjson.dumps({"message": "Spend Tracker API is running"})
 
 
 @app.get("/")
-def read_root():
-    return {"message": "Spend Tracker API is running"}
+async def read_root():
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     """Test endpoint to check if database is available and accessible"""
     response = {
         "backend": "✅ Running",
@@ -45,7 +142,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -64,26 +161,140 @@ def test_database():
 
 # ---------- Helpers ----------
 
-def apply_auto_category(merchant: str, description: Optional[str]) -> Optional[str]:
-    """Return a category if any rule keyword matches merchant or description."""
-    text = f"{merchant} {description or ''}".lower()
-    rules = get_documents("categoryrule")
-    for r in rules:
-        if r.get("keyword", "").lower() in text:
-            return r.get("category")
-    return None
+# Category rules change rarely, so keep a keyword automaton in-process instead of
+# reading the whole collection and scanning it on every transaction insert.
+# `generation` is bumped on every rule write so a reload that was in flight during
+# the write does not store the pre-write rules.
+_rules_cache: Dict[str, Any] = {"ts": float("-inf"), "data": None, "generation": 0}
+
+
+def _build_automaton(rules: List[Dict[str, Any]]) -> Optional[ahocorasick.Automaton]:
+    """Build an Aho-Corasick automaton mapping each keyword to (rule order, category)."""
+    automaton = ahocorasick.Automaton()
+    for idx, r in enumerate(rules):
+        keyword = r.get("keyword", "").lower()
+        # Earlier rules win on duplicate keywords, as with the old linear scan. Empty
+        # keywords (rejected by CategoryRule, but possible in legacy data) are skipped
+        # rather than matching every transaction.
+        if keyword and keyword not in automaton:
+            automaton.add_word(keyword, (idx, r.get("category")))
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
+async def get_rules_cached(ttl: float = 30) -> Optional[ahocorasick.Automaton]:
+    """Return the rules automaton, rebuilding it at most every `ttl` seconds."""
+    now = time.monotonic()
+    if now - _rules_cache["ts"] > ttl:
+        generation = _rules_cache["generation"]
+        automaton = _build_automaton(await get_documents("categoryrule"))
+        if _rules_cache["generation"] != generation:
+            # Rules changed while loading; use this result once but don't cache it
+            return automaton
+        _rules_cache["data"] = automaton
+        _rules_cache["ts"] = now
+    return _rules_cache["data"]
+
+
+def invalidate_rules() -> None:
+    """Force the next get_rules_cached call to reload the rules."""
+    _rules_cache["generation"] += 1
+    _rules_cache["ts"] = float("-inf")
+
+
+def search_text(merchant: str, description: Optional[str]) -> str:
+    """Lowercased merchant and description, stored on each transaction as `_search`."""
+    return f"{merchant} {description or ''}".lower()
+
+
+async def apply_auto_category(search: str) -> Optional[str]:
+    """Return a category if any rule keyword occurs in a transaction's `_search` text."""
+    automaton = await get_rules_cached()
+    if automaton is None:
+        return None
+    # Single pass over the text; the earliest-created matching rule wins
+    best = min((value for _, value in automaton.iter(search)), default=None)
+    return best[1] if best else None
+
+
+@lru_cache(maxsize=64)
+def _month_bounds(month: str) -> Tuple[datetime, datetime]:
+    """Return the [start, end) datetimes of a YYYY-MM month."""
+    y, mo = int(month[:4]), int(month[5:7])
+    start = datetime(y, mo, 1)
+    end = datetime(y + (mo == 12), (mo % 12) + 1, 1)
+    return start, end
+
+
+def as_stored_datetime(dt: datetime) -> datetime:
+    """Return `dt` as Mongo hands it back: naive UTC, truncated to milliseconds."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000)
 
 
 def month_from_date(dt: datetime) -> str:
-    return dt.strftime("%Y-%m")
+    # Mongo stores datetimes as UTC, so bucket aware datetimes by their UTC month
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return f"{dt.year:04d}-{dt.month:02d}"
 
 
-# ---------- Transactions ----------
+def classify_usage(totals: List[float], limits: List[Optional[float]]) -> Tuple[List[float], List[int]]:
+    """Return the % of budget used and a bucket per category.
+
+    Buckets: 2 at or above 90%, 1 at or above 70%, 0 below that, -1 when there
+    is no budget (its percentage is reported as -1.0).
+    """
+    pcts: List[float] = []
+    buckets: List[int] = []
+    for total, limit in zip(totals, limits):
+        if limit:
+            pct = round((total / limit) * 100, 1)
+            bucket = 2 if pct >= 90 else 1 if pct >= 70 else 0
+        else:
+            pct, bucket = -1.0, -1
+        pcts.append(pct)
+        buckets.append(bucket)
+    return pcts, buckets
+
+
+@lru_cache(maxsize=4096)
+def _msg(cat: str, bucket: int, pct: float) -> str:
+    """Recommendation text for a category in a classify_usage bucket."""
+    if bucket == 2:
+        return f"You're at {pct}% of your {cat} budget. Consider reducing spend or raising your limit."
+    if bucket == 1:
+        return f"{cat} spending is trending high at {pct}%. Keep an eye on it."
+    if bucket == 0:
+        return f"{cat} spending is healthy at {pct}%."
+    return f"No budget set for {cat}. Consider adding one to track spending."
+
 
-class TransactionIn(Transaction):
-    pass
+# Encoded /api/insights bodies keyed by (month, category), least recently used
+# first. A month's insights only change when a transaction or budget for it is
+# written, which drops its entries and bumps its version; the TTL bounds staleness
+# from writes made outside this process.
+_INSIGHTS_TTL = 30
+_INSIGHTS_MAX_ENTRIES = 256
+_insights_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, bytes]]" = OrderedDict()
+_insights_versions: Dict[str, int] = {}
+
+
+def invalidate_insights(month: str) -> None:
+    """Drop every cached insights body for `month`."""
+    _insights_versions[month] = _insights_versions.get(month, 0) + 1
+    for key in [k for k in _insights_cache if k[0] == month]:
+        _insights_cache.pop(key, None)
+
+
+# ---------- Transactions ----------
 
 class TransactionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+
     id: str
     amount: float
     merchant: str
@@ -94,88 +305,150 @@ class TransactionOut(BaseModel):
     currency: str
 
 
-def normalize_txn(doc: Dict[str, Any]) -> TransactionOut:
-    return TransactionOut(
-        id=str(doc.get("_id")),
-        amount=doc.get("amount"),
-        merchant=doc.get("merchant"),
-        description=doc.get("description"),
-        category=doc.get("category"),
-        date=doc.get("date"),
-        account=doc.get("account"),
-        currency=doc.get("currency", "USD"),
-    )
+# Fields read by normalize_txn; _id is always returned by Mongo
+TXN_PROJECTION = {field: 1 for field in ("amount", "merchant", "description", "category", "date", "account", "currency")}
+
+
+def normalize_txn(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a Mongo document to the TransactionOut shape as a plain, orjson-ready dict."""
+    return {
+        "id": str(doc.get("_id")),
+        "amount": doc.get("amount"),
+        "merchant": doc.get("merchant"),
+        "description": doc.get("description"),
+        "category": doc.get("category"),
+        "date": doc.get("date"),
+        "account": doc.get("account"),
+        "currency": doc.get("currency", "USD"),
+    }
 
 
 @app.post("/api/transactions", response_model=TransactionOut)
-def create_transaction(payload: TransactionIn):
+async def create_transaction(payload: Transaction):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    data = payload.model_dump()
-    auto = apply_auto_category(data["merchant"], data.get("description"))
+    data = payload.model_dump(mode="python")
+    data["date"] = as_stored_datetime(data["date"])
+    data["_search"] = search_text(data["merchant"], data.get("description"))
+    auto = await apply_auto_category(data["_search"])
     if auto and not data.get("category"):
         data["category"] = auto
-    inserted_id_str = create_document("transaction", data)
+    # With the date normalized, the inserted document matches what Mongo would
+    # return, so build the response from it rather than reading it back.
+    data["_id"] = await create_document("transaction", data)
+    invalidate_insights(month_from_date(data["date"]))
+    return ORJSONResponse(normalize_txn(data))
+
+
+# Same ceiling as the list endpoint's page size
+BULK_MAX_ITEMS = 1000
+
+
+async def insert_bulk(collection_name: str, items: List[Any]) -> Dict[str, int]:
+    """Insert `items` unordered and report how many were written and how many failed."""
+    try:
+        inserted_ids = await create_documents(collection_name, items)
+    except BulkWriteError as exc:
+        return {"inserted": exc.details.get("nInserted", 0), "failed": len(exc.details.get("writeErrors", []))}
+    return {"inserted": len(inserted_ids), "failed": 0}
+
+
+@app.post("/api/transactions/bulk")
+async def create_transactions_bulk(payload: Annotated[List[Transaction], Body(max_length=BULK_MAX_ITEMS)]):
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    docs = []
+    for txn in payload:
+        data = txn.model_dump(mode="python")
+        data["_search"] = search_text(data["merchant"], data.get("description"))
+        if not data.get("category"):
+            data["category"] = await apply_auto_category(data["_search"])
+        docs.append(data)
+    if not docs:
+        return {"inserted": 0, "failed": 0}
     try:
-        doc = db["transaction"].find_one({"_id": ObjectId(inserted_id_str)})
-    except Exception:
-        # Fallback: best-effort fetch by fields with latest timestamp
-        doc = db["transaction"].find_one({"merchant": data["merchant"], "amount": data["amount"]}, sort=[("created_at", -1)])
-    if not doc:
-        raise HTTPException(status_code=500, detail="Failed to fetch created transaction")
-    return normalize_txn(doc)
+        return await insert_bulk("transaction", docs)
+    finally:
+        # Unordered inserts may have written part of the batch even on error
+        for month in {month_from_date(d["date"]) for d in docs}:
+            invalidate_insights(month)
 
 
 @app.get("/api/transactions", response_model=List[TransactionOut])
-def list_transactions(limit: int = Query(100, ge=1, le=1000), category: Optional[str] = None):
+async def list_transactions(limit: int = Query(100, ge=1, le=1000), category: Optional[str] = None):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
     filt: Dict[str, Any] = {}
     if category:
         filt["category"] = category
-    docs = db["transaction"].find(filt).sort("date", -1).limit(limit)
-    return [normalize_txn(d) for d in docs]
+    # Fetch the whole page in one batch and normalize documents as they arrive,
+    # without materializing the raw documents first.
+    cursor = db["transaction"].find(filt, projection=TXN_PROJECTION).sort("date", -1).limit(limit).batch_size(limit)
+    # Returning the response directly skips re-validating every document against
+    # TransactionOut; the response_model is kept for the OpenAPI schema only.
+    return ORJSONResponse([normalize_txn(d) async for d in cursor])
 
 
 @app.get("/api/insights")
-def insights(month: Optional[str] = None):
+async def insights(month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"), category: Optional[str] = None):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
     """Return monthly totals by category and simple budget recommendations."""
     if month is None:
-        month = datetime.utcnow().strftime("%Y-%m")
-    start = datetime.strptime(month + "-01", "%Y-%m-%d")
-    end = (start + timedelta(days=32)).replace(day=1)
-
+        t = datetime.now(timezone.utc)
+        month = f"{t.year:04d}-{t.month:02d}"
+    key = (month, category)
+    cached = _insights_cache.get(key)
+    if cached:
+        if time.monotonic() - cached[0] <= _INSIGHTS_TTL:
+            _insights_cache.move_to_end(key)
+            return Response(content=cached[1], media_type="application/json")
+        del _insights_cache[key]
+    # A write to this month while the aggregation is awaited bumps the version,
+    # and the then-stale result is not cached.
+    version = _insights_versions.get(month, 0)
+    start, end = _month_bounds(month)
+
+    # Keep every filter in the leading $match, with no stage before it, so the
+    # planner can answer it from the date / category+date indexes.
+    match: Dict[str, Any] = {"date": {"$gte": start, "$lt": end}}
+    if category:
+        match["category"] = category
     pipeline = [
-        {"$match": {"date": {"$gte": start, "$lt": end}}},
+        {"$match": match},
         {"$group": {"_id": "$category", "total": {"$sum": "$amount"}, "count": {"$sum": 1}}},
         {"$sort": {"total": -1}},
+        # Join this month's budget server-side instead of a second query
+        {"$lookup": {
+            "from": "budget",
+            "let": {"cat": {"$ifNull": ["$_id", "Uncategorized"]}},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$category", "$$cat"]},
+                    {"$eq": ["$month", month]},
+                ]}}},
+                # Most recently set budget wins if legacy duplicates exist
+                {"$sort": {"updated_at": -1}},
+                {"$limit": 1},
+            ],
+            "as": "budget",
+        }},
+        {"$addFields": {"limit": {"$arrayElemAt": ["$budget.limit", 0]}}},
     ]
-    agg = list(db["transaction"].aggregate(pipeline))
+    agg = await db["transaction"].aggregate(pipeline, allowDiskUse=False).to_list(None)
 
-    budgets = {b["category"]: b for b in db["budget"].find({"month": month})}
+    cats = [item.get("_id") or "Uncategorized" for item in agg]
+    totals = [item.get("total", 0) for item in agg]
+    limits = [item.get("limit") for item in agg]
+    pcts, buckets = classify_usage(totals, limits)
 
     recommendations = []
-    for item in agg:
-        cat = item.get("_id") or "Uncategorized"
-        total = item.get("total", 0)
-        limit = budgets.get(cat, {}).get("limit")
-        if limit:
-            used_pct = round((total / limit) * 100, 1)
-            if used_pct >= 90:
-                msg = f"You're at {used_pct}% of your {cat} budget. Consider reducing spend or raising your limit."
-            elif used_pct >= 70:
-                msg = f"{cat} spending is trending high at {used_pct}%. Keep an eye on it."
-            else:
-                msg = f"{cat} spending is healthy at {used_pct}%."
-        else:
-            msg = f"No budget set for {cat}. Consider adding one to track spending."
+    for cat, total, limit, used_pct, bucket in zip(cats, totals, limits, pcts, buckets):
         recommendations.append({
             "category": cat,
             "spent": round(total, 2),
             "budget": limit,
-            "message": msg
+            "message": _msg(cat, bucket, used_pct)
         })
 
     summary = {
@@ -184,34 +457,55 @@ def insights(month: Optional[str] = None):
         "top_category": recommendations[0]["category"] if recommendations else None,
         "total_spend": round(sum(i.get("spent", 0) for i in recommendations), 2)
     }
-    return summary
+    body = orjson.dumps(summary)
+    if _insights_versions.get(month, 0) == version:
+        _insights_cache[key] = (time.monotonic(), body)
+        _insights_cache.move_to_end(key)
+        while len(_insights_cache) > _INSIGHTS_MAX_ENTRIES:
+            _insights_cache.popitem(last=False)
+    return Response(content=body, media_type="application/json")
 
 
 # ---------- Rules & Budgets ----------
 
-class RuleIn(CategoryRule):
-    pass
-
 @app.post("/api/rules")
-def add_rule(rule: RuleIn):
+async def add_rule(rule: CategoryRule):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    create_document("categoryrule", rule)
+    await create_document("categoryrule", rule)
+    invalidate_rules()
     return {"status": "ok"}
 
 
-class BudgetIn(Budget):
-    pass
+@app.post("/api/rules/bulk")
+async def add_rules_bulk(rules: Annotated[List[CategoryRule], Body(max_length=BULK_MAX_ITEMS)]):
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not available")
+    if not rules:
+        return {"status": "ok", "inserted": 0, "failed": 0}
+    try:
+        return {"status": "ok", **await insert_bulk("categoryrule", rules)}
+    finally:
+        invalidate_rules()
+
 
 @app.post("/api/budgets")
-def set_budget(budget: BudgetIn):
+async def set_budget(budget: Budget):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available")
-    create_document("budget", budget)
+    # One budget per category and month (enforced by a unique index), so setting
+    # a budget again replaces its limit.
+    now = datetime.now(timezone.utc)
+    await db["budget"].update_one(
+        {"category": budget.category, "month": budget.month},
+        {"$set": {"limit": budget.limit, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+        upsert=True,
+    )
+    invalidate_insights(budget.month)
     return {"status": "ok"}
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop", http="httptools")
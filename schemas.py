@@ -3,7 +3,7 @@ Database Schemas for Spend Tracker
 
 Each Pydantic model corresponds to one MongoDB collection (lowercased class name).
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -12,6 +12,8 @@ class Transaction(BaseModel):
     Collection: "transaction"
     A single financial transaction.
     """
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     amount: float = Field(..., gt=0, description="Transaction amount (positive number)")
     merchant: str = Field(..., description="Merchant or payee name")
     description: Optional[str] = Field(None, description="Optional description or memo")
@@ -25,7 +27,9 @@ class CategoryRule(BaseModel):
     Collection: "categoryrule"
     Auto-categorization rule using a keyword match on merchant/description.
     """
-    keyword: str = Field(..., description="Lowercased keyword to match (e.g., 'starbucks')")
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    keyword: str = Field(..., min_length=1, description="Lowercased keyword to match (e.g., 'starbucks')")
     category: str = Field(..., description="Category to assign when keyword matches")
 
 class Budget(BaseModel):
@@ -33,12 +37,16 @@ class Budget(BaseModel):
     Collection: "budget"
     Budget limit per category per month (YYYY-MM).
     """
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     category: str = Field(..., description="Category name")
     month: str = Field(..., pattern=r"^\d{4}-\d{2}$", description="Month in format YYYY-MM")
     limit: float = Field(..., gt=0, description="Spending limit for this category and month")
 
 # Example list of common categories that the UI may suggest
 class CategorySuggestion(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     name: str
     icon: Optional[str] = None
 